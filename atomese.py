@@ -0,0 +1,209 @@
+"""
+Export of converted programs to Atomese for loading into OpenCog AtomSpace.
+
+Node graph built by the converter is translated directly,
+without going through the text form:
+
+    verify_color(brown, $Y) and object(horse, $Y)
+
+becomes
+
+    (AndLink
+        (EvaluationLink (PredicateNode "verify_color")
+            (ListLink (ConceptNode "brown") (VariableNode "$Y")))
+        (EvaluationLink (PredicateNode "object")
+            (ListLink (ConceptNode "horse") (VariableNode "$Y"))))
+
+Each program is attached to its question:
+
+    (EvaluationLink (PredicateNode "gqa_program")
+        (ListLink (ConceptNode "13481535") (AndLink ...)))
+
+Programs are written to scheme files of --batch-size questions,
+each atom is defined once per file and is referred to by name
+in all programs of the file. Names are prefixed with the file number
+(b00003-a17), so files are independent and may be loaded in any order
+or in parallel into one session, e.g. with (load "batch00003.scm").
+
+    python atomese.py questions.json out_dir --workers 8
+"""
+import os
+import argparse
+
+from converter import build_program, build_conjuntion, Filter, Exists, \
+    Disjunction, Conjunction, Relation, Verify, Query, Difference, Equals, \
+    IfElse, IfElseNot, Common, Var, ListVar, var_name
+from reader import iter_batches, iter_questions
+
+
+def arg_term(arg):
+    """
+    term for an argument of atom: variable, list of objects or constant
+    """
+    if isinstance(arg, ListVar):
+        # list($X) is grounded to many objects
+        return ('GlobNode', var_name(arg))
+    if isinstance(arg, Var):
+        return ('VariableNode', var_name(arg))
+    return ('ConceptNode', arg.strip())
+
+
+def evaluation(predicate, args):
+    return ('EvaluationLink', ('PredicateNode', predicate),
+            ('ListLink',) + tuple(arg if isinstance(arg, tuple) else arg_term(arg)
+                                  for arg in args))
+
+
+def atom_term(node):
+    """
+    term for one atom of the conjunction, same as str(node) in the text form
+    """
+    if isinstance(node, Filter):
+        return evaluation(node.filter_type, [node.name, node.variables[0]])
+    if isinstance(node, Exists):
+        return evaluation('exists', [node.variables[0]])
+    if isinstance(node, Relation):
+        return evaluation(node.relation, node.args)
+    if isinstance(node, Verify):
+        return evaluation('verify_' + node.verify_type, [node.verify_arg, node.variables[0]])
+    if isinstance(node, Query):
+        return evaluation('query', [node.arg, node.variables[0]])
+    if isinstance(node, Difference):
+        return evaluation(node._name, [node.arg] + list(node.variables))
+    if isinstance(node, Equals):
+        return evaluation('equals', node.args)
+    if isinstance(node, IfElse):
+        comp = evaluation(node.comparator, node.variables)
+        out = [node.dependencies[0].name, node.dependencies[1].name]
+        if isinstance(node, IfElseNot):
+            out.reverse()
+        return evaluation('cond', [comp] + out)
+    if isinstance(node, Common):
+        return evaluation('query_common', node.variables)
+    if isinstance(node, Disjunction):
+        return ('OrLink',) + tuple(atom_term(d) for d in node.dependencies)
+    if isinstance(node, Conjunction):
+        return ('AndLink',) + tuple(atom_term(d) for d in node.dependencies)
+    raise ValueError('no atomese for {0}'.format(type(node).__name__))
+
+
+def _conjunction(nodes):
+    atoms = []
+    for node in nodes:
+        term = atom_term(node)
+        if term not in atoms:
+            atoms.append(term)
+    return ('AndLink',) + tuple(atoms)
+
+
+def program_term(root):
+    """
+    term for the whole program, mirrors build_expression of the root node
+    """
+    if isinstance(root, Disjunction):
+        conjuncts = []
+        for dep in root.dependencies:
+            tmp = []
+            build_conjuntion(tmp, dep)
+            conjuncts.append(_conjunction(tmp))
+        return ('OrLink',) + tuple(conjuncts)
+    if isinstance(root, Conjunction):
+        return _conjunction(root.build())
+    if isinstance(root, Verify):
+        tmp = []
+        build_conjuntion(tmp, root.dependencies[0])
+        return _conjunction([root] + tmp)
+    conj = [root]
+    for d in root.dependencies:
+        build_conjuntion(conj, d)
+    return _conjunction(conj)
+
+
+def convert_batch(batch):
+    """
+    [(question_id, term)] for batch of (question_id, semantic program)
+    """
+    return [(key, program_term(build_program(sem))) for (key, sem) in batch]
+
+
+def quote(name):
+    return '"' + name.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+class SchemeWriter:
+    """
+    writes terms to a scheme file, defining each EvaluationLink once,
+    names of definitions start with prefix
+    """
+    def __init__(self, path, prefix=''):
+        self.out = open(path, 'w')
+        self.prefix = prefix
+        self.names = dict()
+
+    def _expr(self, term):
+        if isinstance(term[1], str):
+            return '({0} {1})'.format(term[0], quote(term[1]))
+        if term[0] == 'EvaluationLink':
+            name = self.names.get(term)
+            if name is None:
+                link = self._link(term)
+                name = '{0}a{1}'.format(self.prefix, len(self.names))
+                self.out.write('(define {0} {1})\n'.format(name, link))
+                self.names[term] = name
+            return name
+        return self._link(term)
+
+    def _link(self, term):
+        return '({0} {1})'.format(term[0], ' '.join(self._expr(t) for t in term[1:]))
+
+    def add(self, key, term):
+        program = self._expr(term)
+        self.out.write('(EvaluationLink (PredicateNode "gqa_program") '
+                       '(ListLink (ConceptNode {0}) {1}))\n'.format(quote(key), program))
+
+    def close(self):
+        self.out.close()
+
+
+def export(programs, out_dir, batch_size=10000, workers=0):
+    """
+    programs: iterable of (question_id, semantic program)
+    returns number of written files
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    batches = iter_batches(programs, batch_size)
+    if workers:
+        import multiprocessing
+        pool = multiprocessing.Pool(workers)
+        results = pool.imap(convert_batch, batches)
+    else:
+        results = map(convert_batch, batches)
+    count = 0
+    for count, terms in enumerate(results, 1):
+        writer = SchemeWriter(os.path.join(out_dir, 'batch{0:05d}.scm'.format(count - 1)),
+                              prefix='b{0:05d}-'.format(count - 1))
+        for key, term in terms:
+            writer.add(key, term)
+        writer.close()
+    if workers:
+        pool.close()
+        pool.join()
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description='export converted GQA programs to atomese')
+    parser.add_argument('path', help='GQA questions json file')
+    parser.add_argument('out_dir', help='directory for scheme files')
+    parser.add_argument('--batch-size', type=int, default=10000,
+                        help='number of questions per file')
+    parser.add_argument('--workers', type=int, default=0)
+    args = parser.parse_args()
+    programs = ((key, record['semantic'])
+                for (key, record) in iter_questions(open(args.path)))
+    count = export(programs, args.out_dir, args.batch_size, args.workers)
+    print('{0} files written to {1}'.format(count, args.out_dir))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+"""
+Conversion under a memory budget.
+
+Questions are converted in batches, optionally by a pool of workers.
+When resident memory of the main process and the workers grows over
+the budget the batch size and the number of batches in flight are
+halved, and grow back once memory is released.
+"""
+import gc
+import os
+import sys
+import resource
+import multiprocessing
+from collections import deque
+
+from converter import convert_program
+
+
+MB = 1024 * 1024
+
+
+class MemoryBudget:
+    """
+    limit on resident memory of the main process and of its child
+    processes, the pool workers
+    """
+    def __init__(self, limit_mb):
+        self.limit = limit_mb * MB
+        self.warned = False
+        self.peak_total = 0
+
+    @staticmethod
+    def process_rss(pid='self'):
+        with open('/proc/{0}/statm'.format(pid)) as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+    @staticmethod
+    def worker_pids():
+        return [p.pid for p in multiprocessing.active_children()]
+
+    def rss(self):
+        """
+        rss of the main process and of its live child processes
+        """
+        try:
+            total = self.process_rss()
+        except (OSError, ValueError):
+            return self.peak()
+        for pid in self.worker_pids():
+            try:
+                total += self.process_rss(pid)
+            except (OSError, ValueError):
+                # worker exited
+                pass
+        self.peak_total = max(self.peak_total, total)
+        return total
+
+    @staticmethod
+    def peak():
+        # ru_maxrss is in kilobytes on linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    def exceeded(self):
+        if self.rss() <= self.limit:
+            return False
+        gc.collect()
+        return self.rss() > self.limit
+
+    def relaxed(self):
+        return self.rss() < self.limit // 2
+
+    def warn(self):
+        if not self.warned:
+            print('memory budget of {0:.0f} MB is exceeded with minimal batch size'.format(
+                self.limit / MB), file=sys.stderr)
+            self.warned = True
+
+    def report(self, workers=0):
+        print('peak rss: {0:.1f} MB'.format(self.peak() / MB), file=sys.stderr)
+        if workers:
+            # sampled after each batch
+            print('peak rss of main process and workers: {0:.1f} MB'.format(
+                self.peak_total / MB), file=sys.stderr)
+
+
+def convert_batch(batch):
+    result = []
+    for key, record in batch:
+        variables = dict()
+        res = convert_program(record['semantic'], variables)
+        result.append((key, record, res, variables))
+    return result
+
+
+class Throttle:
+    """
+    batch size and number of batches in flight limited by memory budget
+    """
+    def __init__(self, budget, batch_size, depth):
+        self.budget = budget
+        self.max_batch_size = self.batch_size = batch_size
+        self.max_depth = self.depth = depth
+
+    def update(self):
+        if self.budget is None:
+            return
+        if self.budget.exceeded():
+            if self.batch_size == 1 and self.depth == 1:
+                self.budget.warn()
+            self.depth = max(1, self.depth // 2)
+            self.batch_size = max(1, self.batch_size // 2)
+        elif self.budget.relaxed():
+            self.depth = min(self.max_depth, self.depth + 1)
+            self.batch_size = min(self.max_batch_size, self.batch_size * 2)
+
+    def next_batch(self, questions):
+        batch = []
+        for item in questions:
+            batch.append(item)
+            if len(batch) >= self.batch_size:
+                break
+        return batch
+
+
+def convert_questions(questions, budget=None, batch_size=256, workers=0):
+    """
+    yield (question_id, record, converted expression, variables)
+
+    questions: iterable of (question_id, record)
+    budget: MemoryBudget or None
+    """
+    questions = iter(questions)
+    throttle = Throttle(budget, batch_size, depth=max(1, 2 * workers))
+    if not workers:
+        while True:
+            batch = throttle.next_batch(questions)
+            if not batch:
+                return
+            yield from convert_batch(batch)
+            throttle.update()
+    with multiprocessing.Pool(workers) as pool:
+        pending = deque()
+        exhausted = False
+        while True:
+            while not exhausted and len(pending) < throttle.depth:
+                batch = throttle.next_batch(questions)
+                if not batch:
+                    exhausted = True
+                    break
+                pending.append(pool.apply_async(convert_batch, (batch,)))
+            if not pending:
+                return
+            yield from pending.popleft().get()
+            throttle.update()
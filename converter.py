@@ -10,9 +10,63 @@ two_args_re_no = re.compile('^((\w+(?:-\w+)?\s?)+)\((-)\)')
 many_objects = re.compile('^(\w+)\s\((\d+(\,\d+)+)\)')
 one_word = re.compile('^((\w+(?:-\w+)?\s?)+)($)')
 s_re = re.compile('([s|o|_])\s\((.*)\)')
+punct_re = re.compile('[,()]')
 
 varnames = ['$X', '$Y', '$Z', '$E', '$R']
 
+
+def var_name(slot):
+    """
+    name of variable slot in the output, slots after varnames are $V5, $V6, ...
+    """
+    if slot < len(varnames):
+        return varnames[slot]
+    return '$V{0}'.format(int(slot))
+
+
+def var_slot(name):
+    """
+    inverse of var_name
+    """
+    if name in varnames:
+        return varnames.index(name)
+    return int(name[2:])
+
+
+class Var(int):
+    """
+    variable of a program, index of its slot in dense per-program numbering
+
+    Nodes keep Var objects in variables and arguments, so variables
+    can be bound by plain array indexing; names are produced only when
+    nodes are rendered to text.
+
+    Var compares equal to its slot number, Var(1) == 1; use same_var
+    to tell list($X) from $X of the same slot.
+    """
+    def __str__(self):
+        return var_name(self)
+
+    __repr__ = __str__
+
+
+class ListVar(Var):
+    """
+    variable grounded to a list of objects
+    """
+    def __str__(self):
+        return 'list({0})'.format(var_name(self))
+
+    __repr__ = __str__
+
+
+def same_var(a, b):
+    """
+    a and b are the same variable and both are lists or not
+    """
+    return a == b and isinstance(a, ListVar) == isinstance(b, ListVar)
+
+
 class RelType(enum.Enum):
     relation = 0
     complex = 1
@@ -81,7 +135,7 @@ class FilterRelation(RelDesc):
         self.filter_arg = filter_arg
 
     def build(self, *args, **kwargs):
-        assert isinstance(kwargs['var_name'], str)
+        assert isinstance(kwargs['var_name'], Var)
         rel_args, vars = self.get_rel_args(**kwargs)
         f = Filter(filter_type=self.filter_type,
                 name=self.filter_arg, variables=[rel_args[0]],
@@ -578,6 +632,93 @@ relations.update({'pulled by': WornOn('pulling')})
 relations.update({'followed by': WornOn('following')})
 relations.update({'wrapped around': WornOn('wrapped_in')})
 
+
+class RelationLexicon:
+    """
+    Relation tables compiled to a trie of words of the phrases,
+    read from the end of the phrase.
+
+    Phrases missing in the tables are decomposed by the longest known
+    relation at the end and activity before it, like complex_relations:
+    'skating along' -> activity(skating, $X) and along($X, $Y)
+
+    Activity is one of known activity words: activities of complex
+    relations and leading -ing/-ed words of the phrases, e.g. 'riding'
+    of 'riding on'. Other phrases ('wing of', 'red on') are not decomposed.
+    """
+    _activity_suffixes = ('ing', 'ed')
+
+    def __init__(self, relations):
+        self.relations = relations
+        self.trie = dict()
+        self.derived = dict()
+        self.activities = set()
+        for phrase, rel in relations.items():
+            words = phrase.split()
+            if type(rel) in (NormalRelation, WornOn):
+                node = self.trie
+                for word in reversed(words):
+                    node = node.setdefault(word, dict())
+                node[None] = phrase
+            if type(rel) is ComplexRelation and isinstance(rel.rel1, FilterRelation) \
+                    and rel.rel1.filter_type == 'activity':
+                self.activities.add(rel.rel1.filter_arg)
+            if len(words) > 1 and words[0].endswith(self._activity_suffixes):
+                self.activities.add(words[0])
+
+    def longest_suffix(self, words):
+        """
+        number of words and the longest known phrase ending the words
+        """
+        node = self.trie
+        result = (0, None)
+        for i, word in enumerate(reversed(words)):
+            node = node.get(word)
+            if node is None:
+                break
+            if None in node:
+                result = (i + 1, node[None])
+        return result
+
+    def decompose(self, phrase):
+        """
+        ComplexRelation for unknown phrase or None
+        """
+        words = phrase.split()
+        length, base = self.longest_suffix(words)
+        activity = words[:len(words) - length]
+        if base is None or len(activity) != 1 or activity[0] not in self.activities:
+            return None
+        return ComplexRelation(FilterRelation('activity', activity[0]),
+                               self.relations[base])
+
+    def __contains__(self, phrase):
+        return self.get(phrase) is not None
+
+    def get(self, phrase):
+        rel = self.relations.get(phrase)
+        if rel is not None:
+            return rel
+        if phrase not in self.derived:
+            self.derived[phrase] = self.decompose(phrase)
+        return self.derived[phrase]
+
+    def __getitem__(self, phrase):
+        rel = self.get(phrase)
+        if rel is None:
+            raise KeyError(phrase)
+        return rel
+
+
+lexicon = RelationLexicon(relations)
+
+def to_spaces(res):
+    """
+    same as readable form, but without commas and parentheses
+    """
+    return ' '.join(punct_re.sub(' ', res).split())
+
+
 def make_filter(name, var):
     return name + '(' + var + ')'
 
@@ -780,16 +921,30 @@ def build_relate(argument, dependencies, deps, variables, no_obj):
     else:
         depend = deps
     relation = args[1]
-    rel_mapped = relations[relation]
+    rel_mapped = lexicon[relation]
     return rel_mapped.build(rel_type=rel_type,
             depend=depend, var_name=var_name, vars=vars,
             no_obj=no_obj, variables=variables)
 
 def convert(items, ops, variables, no_obj):
-    if not items:
-        return ops[-1].build_expression()
-    item = items[0]
-    items = items[1:]
+    for item in items:
+        convert_operation(item, ops, variables, no_obj)
+    return ops[-1].build_expression()
+
+
+def relate_phrases(operation, argument):
+    """
+    relation phrases looked up in relations table by operation
+    """
+    if operation[0] == 'relate' or (len(operation) > 1 and operation[1] == 'rel'):
+        middle = argument.split(',')[1]
+        if operation[0] == 'choose':
+            return middle.split('|')
+        return [middle]
+    return []
+
+
+def convert_operation(item, ops, variables, no_obj):
     operation = item['operation'].strip().split()
     dependencies = item['dependencies']
     deps = [ops[i] for i in dependencies]
@@ -812,7 +967,7 @@ def convert(items, ops, variables, no_obj):
                 name = name.replace(' ', '_')
                 # match objects to a list!
                 var_name = get_var_name(no_obj, obj_id, variables)
-                ops.append(Filter('object', name.strip(), ['list({0})'.format(var_name)], deps))
+                ops.append(Filter('object', name.strip(), [ListVar(var_name)], deps))
             assert ' ' not in obj_id
             assert ' ' not in name
         else:
@@ -890,13 +1045,12 @@ def convert(items, ops, variables, no_obj):
         ops.append(Common(dependencies=deps, variables=vars))
     else:
         import pdb;pdb.set_trace()
-    return convert(items, ops, variables, no_obj)
 
 
 def same_difference_params(argument, deps, operation):
     if len(deps) == 2:
         vars = deps[0].variables[0], deps[1].variables[0]
-        assert all(not x.startswith('[') for x in vars)
+        assert all(isinstance(x, Var) for x in vars)
     if len(deps) == 1:
         vars = [deps[0].variables[0]]
         assert len(deps[0].variables) == 1
@@ -905,11 +1059,31 @@ def same_difference_params(argument, deps, operation):
     return vars
 
 
+def scan_relations(questions):
+    """
+    count relation phrases of questions which are missing in relation tables,
+    returns {phrase: count} for unmapped phrases and for decomposed ones
+    """
+    unmapped = defaultdict(int)
+    decomposed = defaultdict(int)
+    for key, record in questions:
+        for item in record['semantic']:
+            operation = item['operation'].strip().split()
+            for phrase in relate_phrases(operation, item['argument']):
+                if phrase in relations:
+                    continue
+                if phrase in lexicon:
+                    decomposed[phrase] += 1
+                else:
+                    unmapped[phrase] += 1
+    return unmapped, decomposed
+
+
 def extract_deps(deps):
     vars = []
     for d in deps:
         for var in d.variables:
-            if var not in vars:
+            if not any(same_var(var, v) for v in vars):
                 vars.append(var)
     return vars
 
@@ -919,27 +1093,169 @@ def get_var_name(no_obj, obj_id, variables):
         obj_id = obj_id + str(no_obj[0])
         no_obj[0] += 1
     if obj_id not in variables:
-        variables[obj_id] = varnames[len(variables)]
+        variables[obj_id] = Var(len(variables))
     var_name = variables[obj_id]
     return var_name
 
 
-def main():
-    import sys
-    if len(sys.argv) != 2:
-        print('give path to TRAIN json file as an argument')
-    path = sys.argv[1]
-    data = json.load(open(path))
+def convert_program(sem, variables=None):
+    if variables is None:
+        variables = dict()
+    no_obj_count = [0]
+    items = []
+    return convert(sem, items, variables, no_obj_count)
 
-    for i, key in enumerate(data.keys()):
-        sem = data[key]['semantic']
+
+def build_program(sem, variables=None):
+    """
+    node graph of the program, returns the last node
+    """
+    if variables is None:
         variables = dict()
-        no_obj_count = [0]
-        items = []
-        # print(i)
-        # print(json.dumps(data[key]['semantic'], indent=2))
-        print('{0}: '.format(key), data[key]['question'])
-        res = convert(sem, items, variables, no_obj_count)
-        print('{0}: '.format(key), res)
+    no_obj_count = [0]
+    items = []
+    for item in sem:
+        convert_operation(item, items, variables, no_obj_count)
+    return items[-1]
+
+
+def write_result(out, key, question, res):
+    print('{0}: '.format(key), question, file=out)
+    print('{0}: '.format(key), res, file=out)
+
 
-main()
+def main():
+    import sys
+    import argparse
+    parser = argparse.ArgumentParser(description='convert GQA programs to semi-logical form',
+                                     fromfile_prefix_chars='@')
+    parser.add_argument('path', help='path to TRAIN json file')
+    parser.add_argument('--output', help='write converted programs to file instead of stdout')
+    parser.add_argument('--manifest', help='json file with relation phrases and operations '
+                        'used by each question')
+    parser.add_argument('--rebuild', action='store_true',
+                        help='reconvert only questions affected by changes in relation tables '
+                        'since --manifest was written, patch --output in place')
+    parser.add_argument('--handler', action='append', default=[],
+                        help='with --rebuild also reconvert questions using this operation, '
+                        'e.g. "choose" or "verify rel"')
+    parser.add_argument('--question-id', action='append', default=[],
+                        help='convert only this question, repeat for several ids; '
+                        'options may be read one per line from @file')
+    parser.add_argument('--image-id', action='append', default=[],
+                        help='convert only questions about this image')
+    parser.add_argument('--operation', action='append', default=[],
+                        help='convert only programs with this step, e.g. "choose" or "verify rel"')
+    parser.add_argument('--type', action='append', default=[],
+                        help='convert only questions of this type, e.g. "structural=compare" '
+                        'or "compare"')
+    parser.add_argument('--stats', help='write dataset statistics to this json file')
+    parser.add_argument('--stats-top-k', type=int, default=100,
+                        help='number of most frequent relation phrases to keep in statistics')
+    parser.add_argument('--memory-budget', type=float,
+                        help='stream the input and keep resident memory under this many MB')
+    parser.add_argument('--batch-size', type=int, default=256,
+                        help='number of questions converted at once')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='number of worker processes')
+    parser.add_argument('--pipeline', action='store_true',
+                        help='read, convert and write in separate stages')
+    parser.add_argument('--queue-size', type=int, default=1024,
+                        help='capacity of queues between pipeline stages')
+    parser.add_argument('--shards', help='write length-bucketed shuffled shards to directory')
+    parser.add_argument('--bucket-boundaries',
+                        help='comma separated token lengths where buckets start, '
+                        'default 8,16,24,32,48,64,96,128')
+    parser.add_argument('--shard-size', type=int, default=100000,
+                        help='number of records in shard')
+    parser.add_argument('--seed', type=int, default=0, help='seed of shuffling in buckets')
+    parser.add_argument('--scan-relations', action='store_true',
+                        help='only list relation phrases missing in relation tables')
+    args = parser.parse_args()
+    if args.rebuild and not (args.output and args.manifest):
+        parser.error('--rebuild requires --output and --manifest')
+    path = args.path
+
+    if args.rebuild:
+        import incremental
+        data = json.load(open(path))
+        incremental.rebuild(data, args.output, args.manifest, args.handler)
+        return
+
+    import reader
+    import budget
+    record_filter = reader.RecordFilter(question_ids=args.question_id,
+                                        image_ids=args.image_id,
+                                        operations=args.operation,
+                                        types=args.type)
+    if args.scan_relations:
+        # phrases are taken from the programs, nothing is converted
+        unmapped, decomposed = scan_relations(reader.iter_questions(open(path), record_filter))
+        for phrase, count in sorted(unmapped.items(), key=lambda x: -x[1]):
+            print('{0:8d}  {1}'.format(count, phrase))
+        for phrase, count in sorted(decomposed.items(), key=lambda x: -x[1]):
+            rel = lexicon[phrase]
+            print('{0:8d}  {1}  ->  activity({2}) and {3}'.format(
+                count, phrase, rel.rel1.filter_arg, rel.rel2.rel_name))
+        return
+
+    memory_budget = None
+    if args.memory_budget:
+        memory_budget = budget.MemoryBudget(args.memory_budget)
+    if memory_budget:
+        questions = reader.iter_questions(open(path), record_filter, chunk_size=1 << 18)
+    elif record_filter or args.pipeline:
+        # filters are applied to raw text of records while streaming the file
+        questions = reader.iter_questions(open(path), record_filter)
+    else:
+        questions = json.load(open(path)).items()
+    if args.pipeline:
+        import pipeline
+        results = pipeline.Pipeline(questions, args.queue_size, memory_budget,
+                                    args.batch_size, args.workers)
+    else:
+        results = budget.convert_questions(questions, memory_budget,
+                                           args.batch_size, args.workers)
+
+    if args.manifest:
+        import incremental
+    if args.stats:
+        import stats
+        dataset_stats = stats.DatasetStats(args.stats_top_k)
+    shard_writer = None
+    if args.shards:
+        import shards
+        boundaries = None
+        if args.bucket_boundaries:
+            boundaries = [int(x) for x in args.bucket_boundaries.split(',')]
+        shard_writer = shards.ShardWriter(args.shards, boundaries, args.seed, args.shard_size)
+    out = open(args.output, 'w', buffering=1 << 20) if args.output else sys.stdout
+    usage = dict()
+    for i, (key, record, res, variables) in enumerate(results):
+        sem = record['semantic']
+        # print(i)
+        # print(json.dumps(record['semantic'], indent=2))
+        if args.output or not args.shards:
+            write_result(out, key, record['question'], res)
+        if shard_writer:
+            shard_writer.add(key, record['question'], res)
+        if args.stats:
+            dataset_stats.add(sem, res, variables)
+        if args.manifest:
+            usage[key] = incremental.program_usage(sem)
+    if out is not sys.stdout:
+        out.close()
+    if args.manifest:
+        incremental.write_manifest(args.manifest, usage)
+    if args.stats:
+        dataset_stats.save(args.stats)
+    if shard_writer:
+        shard_writer.close()
+    if memory_budget:
+        memory_budget.report(args.workers)
+    if args.pipeline:
+        results.report()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,276 @@
+"""
+Differential check of alternative conversion engines against converter.convert_program.
+
+Engine is any function taking semantic program and returning
+the converted expression, given as module:function
+
+    python equivalence.py fast_converter:convert_program --questions val_all_questions.json --workers 8
+    python equivalence.py fast_converter:convert_program --synthetic 100000 --seed 1
+
+Expressions are compared as strings, so variable naming and order of
+conjuncts must be the same. Reports the first divergent question.
+
+Reference is a private copy of converter.py loaded before the engine,
+so engines changing globals of converter (relations, varnames) don't
+change the reference.
+"""
+import re
+import sys
+import random
+import difflib
+import argparse
+import importlib
+import importlib.util
+import itertools
+
+import converter
+from converter import relations, RelateSame
+from reader import iter_batches, iter_questions
+
+
+_split_re = re.compile('( and | or )')
+
+engine = None
+reference = None
+
+
+def load_engine(spec):
+    module, function = spec.split(':')
+    return getattr(importlib.import_module(module), function)
+
+
+def load_reference():
+    """
+    convert_program of a fresh copy of converter.py, not shared with the engine
+    """
+    spec = importlib.util.spec_from_file_location('_reference_converter', converter.__file__)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.convert_program
+
+
+def _init_worker(spec):
+    global engine, reference
+    reference = load_reference()
+    engine = load_engine(spec)
+
+
+def run(function, sem):
+    """
+    exceptions are part of the result, engines must fail on the same programs
+    """
+    try:
+        return function(sem)
+    except Exception as e:
+        return 'error: {0}'.format(type(e).__name__)
+
+
+def check_batch(batch):
+    """
+    number of equal programs and first divergent (question_id, reference, result)
+    in batch or None
+    """
+    for i, (key, sem) in enumerate(batch):
+        expected = run(reference, sem)
+        result = run(engine, sem)
+        if expected != result:
+            return i, (key, expected, result)
+    return len(batch), None
+
+
+def atom_diff(reference, result):
+    """
+    diff of expressions split to atoms and connectives
+    """
+    diff = difflib.unified_diff(_split_re.split(reference), _split_re.split(result),
+                                'reference', 'engine', n=1, lineterm='')
+    return '\n'.join(diff)
+
+
+def synthetic_programs(count, seed=0):
+    """
+    random gqa-like programs, yield (id, semantic program)
+
+    programs cover every branch of convert_operation: selects of one,
+    no and many objects, typed and type-less steps, relations,
+    comparatives and steps with one or two dependencies
+    """
+    rng = random.Random(seed)
+    phrases = sorted(k for (k, v) in relations.items() if not isinstance(v, RelateSame))
+    names = ['man', 'car', 'table', 'hot dog', 'street', 'dog', 'cup', 'shirt']
+    # names of list selects are single words
+    list_names = ['cups', 'animals', 'people', 'plates']
+    ids = itertools.count(1000)
+
+    def step(operation, deps, argument=''):
+        return dict(operation=operation, dependencies=deps, argument=argument)
+
+    def obj_id():
+        return '-' if rng.random() < 0.1 else str(next(ids))
+
+    def select(sem):
+        kind = rng.randrange(10)
+        if kind == 0:
+            argument = rng.choice(names)
+        elif kind == 1:
+            argument = '{0} (-)'.format(rng.choice(names))
+        else:
+            argument = '{0} ({1})'.format(rng.choice(names), next(ids))
+        sem.append(step('select', [], argument))
+        return len(sem) - 1
+
+    def select_list(sem):
+        many = ','.join(str(next(ids)) for _ in range(rng.randint(2, 4)))
+        sem.append(step('select', [], '{0} ({1})'.format(rng.choice(list_names), many)))
+        return len(sem) - 1
+
+    def relate(sem, dep):
+        sem.append(step('relate', [dep], '{0},{1},{2} ({3})'.format(
+            rng.choice(names + ['_']), rng.choice(phrases), rng.choice('so'), obj_id())))
+        return len(sem) - 1
+
+    def subject(sem):
+        dep = select(sem)
+        for _ in range(rng.randint(0, 2)):
+            dep = relate(sem, dep)
+        return dep
+
+    def verify(sem, dep):
+        kind = rng.randrange(3)
+        if kind == 0:
+            sem.append(step('verify color', [dep], 'red'))
+        elif kind == 1:
+            sem.append(step('verify', [dep], 'standing'))
+        else:
+            sem.append(step('verify rel', [dep], '{0},{1},{2} ({3})'.format(
+                rng.choice(names), rng.choice(phrases), rng.choice('so'), obj_id())))
+        return len(sem) - 1
+
+    def exist(sem, dep):
+        kind = rng.randrange(4)
+        if kind == 0:
+            sem.append(step('filter color', [dep], 'white'))
+            dep = len(sem) - 1
+        elif kind == 1:
+            sem.append(step('filter', [dep], 'standing'))
+            dep = len(sem) - 1
+        elif kind == 2:
+            sem.append(step('filter not color', [dep], 'white'))
+            dep = len(sem) - 1
+        sem.append(step('exist', [dep]))
+        return len(sem) - 1
+
+    def final(sem):
+        kind = rng.randrange(16)
+        if kind == 0:
+            sem.append(step('query', [subject(sem)], 'name'))
+        elif kind == 1:
+            verify(sem, subject(sem))
+        elif kind == 2:
+            exist(sem, subject(sem))
+        elif kind == 3:
+            first = verify(sem, subject(sem))
+            second = verify(sem, subject(sem))
+            sem.append(step('and', [first, second]))
+        elif kind == 4:
+            first = exist(sem, subject(sem))
+            second = exist(sem, subject(sem))
+            sem.append(step('or', [first, second]))
+        elif kind == 5:
+            sem.append(step('choose color', [subject(sem)], 'red|blue'))
+        elif kind == 6:
+            sem.append(step('choose', [subject(sem)], 'standing|sitting'))
+        elif kind == 7:
+            sem.append(step('choose rel', [subject(sem)], '{0},{1}|{2},s ({3})'.format(
+                rng.choice(names), rng.choice(phrases), rng.choice(phrases), obj_id())))
+        elif kind == 8:
+            # dependency of comparatives may be a relation, converter fails on it
+            first = subject(sem)
+            sem.append(step('choose healthier', [first, select(sem)]))
+        elif kind == 9:
+            first = select(sem)
+            sem.append(step('choose less healthy', [first, select(sem)]))
+        elif kind in (10, 11):
+            name = 'same' if kind == 10 else 'different'
+            first = subject(sem)
+            sem.append(step(name + ' color', [first, subject(sem)]))
+        elif kind in (12, 13):
+            # all objects of the list are the same
+            name = 'same' if kind == 12 else 'different'
+            sem.append(step(name, [select_list(sem)], 'color'))
+        elif kind == 14:
+            first = subject(sem)
+            sem.append(step('common', [first, subject(sem)]))
+        else:
+            sem.append(step('query', [select_list(sem)], 'color'))
+
+    for i in range(count):
+        sem = []
+        final(sem)
+        yield 'synthetic{0}'.format(i), sem
+
+
+def check(programs, spec, workers=0, batch_size=256):
+    """
+    returns number of equal programs before the first divergence and
+    the divergence or None
+    """
+    batches = iter_batches(programs, batch_size)
+    checked = 0
+    if not workers:
+        _init_worker(spec)
+        results = map(check_batch, batches)
+    else:
+        import multiprocessing
+        # failing initializer makes the pool respawn workers forever,
+        # so a bad spec has to fail here
+        load_engine(spec)
+        pool = multiprocessing.Pool(workers, _init_worker, (spec,))
+        # imap keeps order of batches, so divergence found first is the first in input
+        results = pool.imap(check_batch, batches)
+    try:
+        for equal, divergence in results:
+            checked += equal
+            if divergence is not None:
+                return checked, divergence
+    finally:
+        if workers:
+            pool.terminate()
+    return checked, None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='compare conversion engine with converter.py')
+    parser.add_argument('engine', help='module:function taking semantic program')
+    parser.add_argument('--questions', help='GQA questions json file')
+    parser.add_argument('--synthetic', type=int, default=0,
+                        help='number of random programs to check')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=0)
+    parser.add_argument('--batch-size', type=int, default=256)
+    args = parser.parse_args()
+    if args.questions:
+        programs = ((key, record['semantic'])
+                    for (key, record) in iter_questions(open(args.questions)))
+    elif args.synthetic:
+        programs = synthetic_programs(args.synthetic, args.seed)
+    else:
+        parser.error('give --questions or --synthetic')
+    try:
+        load_engine(args.engine)
+    except (ValueError, ImportError, AttributeError) as e:
+        parser.error('cannot load engine {0}: {1}'.format(args.engine, e))
+    checked, divergence = check(programs, args.engine, args.workers, args.batch_size)
+    if divergence is None:
+        print('{0} programs, no divergence'.format(checked))
+        return
+    key, reference, result = divergence
+    print('first divergent question: {0}'.format(key))
+    print('reference: ', reference)
+    print('engine:    ', result)
+    print(atom_diff(reference, result))
+    sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+"""
+Incremental re-conversion.
+
+Manifest records relation phrases, operations and node classes used
+by each question, a fingerprint of each entry of the relations table
+and of each node class. After editing the table or rendering of nodes
+only questions using changed entries are converted again, the output
+file is patched in place.
+"""
+import os
+import json
+import inspect
+import hashlib
+import functools
+
+import converter
+from converter import relations, lexicon, RelDesc, Node, convert_program, build_program, \
+    write_result, relate_phrases
+from reader import handler_used
+
+
+@functools.lru_cache(maxsize=None)
+def class_source(cls):
+    try:
+        return inspect.getsource(cls)
+    except (OSError, TypeError):
+        return cls.__qualname__
+
+
+def describe_class(cls):
+    """
+    source and class attributes of cls and its bases, so edits of
+    build methods and of attributes like OnTheEdge._position are noticed
+    """
+    parts = []
+    for klass in cls.__mro__:
+        if klass is object:
+            continue
+        attrs = ', '.join('{0}={1!r}'.format(k, v) for (k, v) in sorted(vars(klass).items())
+                          if not k.startswith('__') and not callable(v)
+                          and not isinstance(v, (staticmethod, classmethod)))
+        parts.append('{0}[{1}]'.format(class_source(klass), attrs))
+    return '\n'.join(parts)
+
+
+def describe(rel):
+    """
+    Text description of a relation mapping entry, changes whenever
+    the entry or code of its class is edited
+    """
+    if isinstance(rel, RelDesc):
+        fields = ', '.join('{0}={1}'.format(k, describe(v))
+                           for (k, v) in sorted(vars(rel).items()))
+        return '{0}({1})\n{2}'.format(type(rel).__name__, fields, describe_class(type(rel)))
+    return repr(rel)
+
+
+def fingerprint(rel):
+    return hashlib.sha1(describe(rel).encode('utf-8')).hexdigest()[:16]
+
+
+def relation_fingerprints(phrases=()):
+    """
+    fingerprints of relations table and of phrases decomposed by lexicon
+    """
+    result = {k: fingerprint(v) for (k, v) in relations.items()}
+    for phrase in phrases:
+        if phrase not in result:
+            result[phrase] = fingerprint(lexicon.get(phrase))
+    return result
+
+
+def node_fingerprints(names):
+    """
+    fingerprints of node classes by class name, source of Node is included
+    through the mro
+    """
+    result = dict()
+    for name in names:
+        cls = getattr(converter, name, None)
+        if isinstance(cls, type) and issubclass(cls, Node):
+            result[name] = fingerprint_class(cls)
+    return result
+
+
+def fingerprint_class(cls):
+    return hashlib.sha1(describe_class(cls).encode('utf-8')).hexdigest()[:16]
+
+
+def node_classes(root):
+    """
+    names of classes of nodes rendered for the program
+    """
+    names = []
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        name = type(node).__name__
+        if name not in names:
+            names.append(name)
+        stack.extend(node.dependencies)
+    return sorted(names)
+
+
+def program_usage(sem):
+    phrases = []
+    operations = []
+    for item in sem:
+        operation = item['operation'].strip().split()
+        op = ' '.join(operation)
+        if op not in operations:
+            operations.append(op)
+        for phrase in relate_phrases(operation, item['argument']):
+            if phrase not in phrases:
+                phrases.append(phrase)
+    return dict(relations=phrases, operations=operations,
+                nodes=node_classes(build_program(sem)))
+
+
+def write_manifest(path, usage):
+    phrases = set(p for u in usage.values() for p in u['relations'])
+    nodes = set(n for u in usage.values() for n in u['nodes'])
+    manifest = dict(fingerprints=relation_fingerprints(phrases),
+                    node_fingerprints=node_fingerprints(nodes), questions=usage)
+    with open(path, 'w') as f:
+        json.dump(manifest, f)
+
+
+def _changed(old, new):
+    return set(k for k in set(old) | set(new) if old.get(k) != new.get(k))
+
+
+def affected_questions(manifest, handlers=()):
+    old = manifest['fingerprints']
+    changed = _changed(old, relation_fingerprints(old))
+    old_nodes = manifest.get('node_fingerprints', dict())
+    changed_nodes = _changed(old_nodes, node_fingerprints(old_nodes))
+    result = []
+    for key, usage in manifest['questions'].items():
+        if changed.intersection(usage['relations']) or \
+                changed_nodes.intersection(usage.get('nodes', ())) or \
+                handler_used(usage['operations'], handlers):
+            result.append(key)
+    return result
+
+
+def patch_output(path, data, keys):
+    """
+    reconvert questions from keys and replace their lines in output file
+    """
+    keys = set(keys)
+    tmp_path = path + '.tmp'
+    with open(path) as src, open(tmp_path, 'w') as out:
+        while True:
+            question_line = src.readline()
+            if not question_line:
+                break
+            result_line = src.readline()
+            key = question_line.split(': ', 1)[0]
+            if key in keys:
+                res = convert_program(data[key]['semantic'])
+                write_result(out, key, data[key]['question'], res)
+            else:
+                out.write(question_line)
+                out.write(result_line)
+    os.replace(tmp_path, path)
+
+
+def rebuild(data, output, manifest_path, handlers=()):
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    keys = affected_questions(manifest, handlers)
+    if keys:
+        patch_output(output, data, keys)
+    for key in keys:
+        manifest['questions'][key] = program_usage(data[key]['semantic'])
+    manifest['fingerprints'] = relation_fingerprints(manifest['fingerprints'])
+    nodes = set(n for u in manifest['questions'].values() for n in u.get('nodes', ()))
+    manifest['node_fingerprints'] = node_fingerprints(nodes)
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f)
+    print('reconverted {0} of {1} questions'.format(len(keys),
+                                                     len(manifest['questions'])))
@@ -0,0 +1,308 @@
+"""
+Parser of converted programs back into converter nodes.
+
+Reads both forms written by the converter:
+
+    readable: cond(healthier($X, $Y), hot_dog, tomato) and object(tomato, $X)
+    spaces:   cond healthier $X $Y hot_dog tomato and object tomato $X
+
+Result is Conjunction of atoms, or Disjunction of two Conjunctions,
+atoms are Filter, Relation, Verify, Query, Exists, Same, Difference,
+Equals, IfElse and Common nodes without dependencies.
+to_text renders the result back to readable form.
+
+Spaces form loses commas and parentheses, multi-word names are
+restored by the number of trailing variables.
+
+    python lf_parser.py output.txt [--spaces] [--benchmark]
+"""
+import re
+import time
+import argparse
+
+from converter import Node, Filter, Exists, Disjunction, Conjunction, Relation, \
+    Verify, Query, Difference, Same, Equals, IfElse, IfElseNot, Common, extract_deps, \
+    Var, ListVar, var_slot, same_var
+
+
+_delim_re = re.compile('[(),]')
+
+
+def _node(cls, variables, **fields):
+    """
+    parsed atoms have no dependencies, skip checks of the constructors
+    """
+    node = cls.__new__(cls)
+    Node.__init__(node, [], list(variables))
+    node.__dict__.update(fields)
+    return node
+
+
+def to_var(arg):
+    """
+    variable slot for variable name, other arguments are returned as is
+    """
+    if isinstance(arg, str):
+        if arg.startswith('$'):
+            return Var(var_slot(arg))
+        if arg.startswith('list($'):
+            return ListVar(var_slot(arg[5:-1]))
+    return arg
+
+
+def is_var(arg):
+    return isinstance(arg, Var)
+
+
+def _find_object(atoms, name, var):
+    for a in atoms:
+        if isinstance(a, Filter) and a.filter_type == 'object' and a.name == name \
+                and same_var(a.variables[0], var):
+            return a
+    return None
+
+
+def _cond(comparator, comp_args, out1, out2, atoms):
+    """
+    cond(comp($X, $Y), out1, out2): IfElse when out1 is object of $X,
+    IfElseNot (less healthy) when outputs go in reverse order;
+    equal outputs read the same both ways and give IfElse
+    """
+    first = _find_object(atoms, out1, comp_args[0])
+    second = _find_object(atoms, out2, comp_args[1])
+    cls = IfElse
+    if first is None or second is None:
+        swapped = (_find_object(atoms, out2, comp_args[0]),
+                   _find_object(atoms, out1, comp_args[1]))
+        if None not in swapped:
+            cls = IfElseNot
+            first, second = swapped
+    if first is None:
+        first = _node(Filter, [comp_args[0]], filter_type='object', name=out1)
+    if second is None:
+        second = _node(Filter, [comp_args[1]], filter_type='object', name=out2)
+    node = _node(cls, comp_args, comparator=comparator)
+    node.dependencies = [first, second]
+    return node
+
+
+def make_atom(name, args, atoms=()):
+    """
+    name, args: predicate and arguments of the atom, nested atoms
+    are (name, args) tuples
+    atoms: atoms of the conjunction, objects of cond are looked up there
+    """
+    args = [to_var(a) for a in args]
+    if name == 'cond':
+        (comparator, comp_args), out1, out2 = args
+        return _cond(comparator, [to_var(a) for a in comp_args], out1, out2, atoms)
+    if name == 'Or':
+        deps = [make_atom(n, a) for (n, a) in args]
+        return _node(Disjunction, extract_deps(deps), dependencies=deps)
+    if name == 'exists':
+        return _node(Exists, args)
+    if name == 'query':
+        return _node(Query, args[1:], arg=args[0])
+    if name == 'query_common':
+        return _node(Common, args)
+    if name == 'equals':
+        return _node(Equals, args, args=args)
+    if name == 'same':
+        return _node(Same, args[1:], arg=args[0])
+    if name == 'different':
+        return _node(Difference, args[1:], arg=args[0])
+    if name.startswith('verify_'):
+        return _node(Verify, args[1:], verify_type=name[len('verify_'):], verify_arg=args[0])
+    if len(args) == 2 and not is_var(args[0]):
+        return _node(Filter, args[1:], filter_type=name, name=args[0])
+    return _node(Relation, [a for a in args if is_var(a)], relation=name, args=args)
+
+
+def _parse_call(text, pos):
+    """
+    parse name(arg, ...) at pos, returns name, arguments and position after it
+    """
+    start = text.index('(', pos)
+    name = text[pos:start]
+    args = []
+    pos = start + 1
+    while True:
+        m = _delim_re.search(text, pos)
+        if m is None:
+            raise ValueError('unbalanced parentheses: {0}'.format(text))
+        if m.group() == '(':
+            sub_name, sub_args, pos = _parse_call(text, pos)
+            if sub_name == 'list':
+                args.append('list({0})'.format(sub_args[0]))
+            else:
+                args.append((sub_name, sub_args))
+            delim = text[pos]
+            pos += 1
+        else:
+            args.append(text[pos:m.start()])
+            delim = m.group()
+            pos = m.end()
+        if delim == ')':
+            return name, args, pos
+        if text.startswith(' ', pos):
+            pos += 1
+
+
+def _build_branch(items, build, is_cond):
+    """
+    atoms of one conjunction, cond atoms are built after the others,
+    as their objects usually follow them
+    """
+    atoms = [None if is_cond(item) else build(item, ()) for item in items]
+    objects = [a for a in atoms if a is not None]
+    for i, item in enumerate(items):
+        if atoms[i] is None:
+            atoms[i] = build(item, objects)
+    return atoms
+
+
+def _root(branches):
+    conjunctions = [Conjunction(dependencies=atoms, variables=extract_deps(atoms))
+                    for atoms in branches]
+    if len(conjunctions) == 1:
+        return conjunctions[0]
+    return Disjunction(dependencies=conjunctions, variables=extract_deps(conjunctions))
+
+
+def parse(text):
+    """
+    parse readable form
+    """
+    branches = [[]]
+    pos = 0
+    end = len(text)
+    while pos < end:
+        name, args, pos = _parse_call(text, pos)
+        branches[-1].append((name, args))
+        if text.startswith(' and ', pos):
+            pos += 5
+        elif text.startswith(' or ', pos):
+            pos += 4
+            branches.append([])
+        elif pos < end:
+            raise ValueError('expected and/or at {0}: {1}'.format(pos, text))
+    return _root([_build_branch(calls, lambda call, atoms: make_atom(call[0], call[1], atoms),
+                                lambda call: call[0] == 'cond')
+                  for calls in branches])
+
+
+def _spaces_atom(tokens, atoms):
+    if tokens[0] == 'cond':
+        comp_args = tokens[2:4]
+        return make_atom('cond', [(tokens[1], comp_args), tokens[4], tokens[5]], atoms)
+    names = []
+    variables = []
+    i = 0
+    while i < len(tokens):
+        if tokens[i] == 'list' and i + 1 < len(tokens) and tokens[i + 1].startswith('$'):
+            variables.append('list({0})'.format(tokens[i + 1]))
+            i += 2
+            continue
+        if tokens[i].startswith('$'):
+            variables.append(tokens[i])
+        else:
+            names.append(tokens[i])
+        i += 1
+    if tokens[0] in ('same', 'different'):
+        return make_atom(tokens[0], names[1:] + variables)
+    if len(names) == 1:
+        return make_atom(names[0], variables)
+    if len(variables) == 1:
+        return make_atom(names[0], [' '.join(names[1:])] + variables)
+    if len(variables) == 2:
+        return make_atom(' '.join(names), variables)
+    return make_atom(names[0], names[1:] + variables)
+
+
+def parse_spaces(text):
+    """
+    parse spaces form
+    """
+    branches = [[]]
+    tokens = []
+    for token in text.split() + ['and']:
+        if token in ('and', 'or'):
+            if tokens:
+                branches[-1].append(tokens)
+                tokens = []
+            if token == 'or':
+                branches.append([])
+        else:
+            tokens.append(token)
+    return _root([_build_branch(atoms, _spaces_atom, lambda tokens: tokens[0] == 'cond')
+                  for atoms in branches])
+
+
+def to_text(root):
+    """
+    readable form of parsed program
+    """
+    if isinstance(root, Disjunction):
+        return ' or '.join(str(c) for c in root.dependencies)
+    return str(root)
+
+
+def split_line(line):
+    """
+    question id and text of output line
+    """
+    key, text = line.rstrip('\n').split(' ', 1)
+    return key.rstrip(':'), text.lstrip(' ')
+
+
+def iter_output(f, spaces=False):
+    """
+    yield (question_id, node) from converter output,
+    lines go in pairs: question and converted program
+    """
+    parse_line = parse_spaces if spaces else parse
+    for question_line in f:
+        try:
+            result_line = next(f)
+        except StopIteration:
+            raise ValueError('no converted program after question line: {0}'.format(
+                question_line.rstrip('\n'))) from None
+        key, text = split_line(result_line)
+        yield key, parse_line(text)
+
+
+def benchmark(path, spaces=False):
+    parse_line = parse_spaces if spaces else parse
+    with open(path) as f:
+        lines = [split_line(line)[1] for line in f][1::2]
+    size = sum(len(line) for line in lines)
+    start = time.perf_counter()
+    for line in lines:
+        parse_line(line)
+    elapsed = time.perf_counter() - start
+    print('{0} programs in {1:.2f}s: {2:.0f} programs/s, {3:.1f} MB/s'.format(
+        len(lines), elapsed, len(lines) / elapsed, size / elapsed / 1024 / 1024))
+    if not spaces:
+        # text of single atoms may end with ' and ', such lines are not rendered back
+        different = sum(1 for line in lines
+                        if to_text(parse(line)) != line and not line.endswith(' and '))
+        print('{0} programs differ after rendering back'.format(different))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='parse converted programs')
+    parser.add_argument('path', help='output of converter.py')
+    parser.add_argument('--spaces', action='store_true', help='file is in spaces form')
+    parser.add_argument('--benchmark', action='store_true',
+                        help='measure throughput and check rendering back')
+    args = parser.parse_args()
+    if args.benchmark:
+        benchmark(args.path, args.spaces)
+        return
+    with open(args.path) as f:
+        for key, root in iter_output(f, args.spaces):
+            print('{0}: '.format(key), to_text(root))
+
+
+if __name__ == '__main__':
+    main()
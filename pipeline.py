@@ -0,0 +1,134 @@
+"""
+Pipelined conversion: reader, converter and writer stages
+connected by bounded queues.
+
+Reader thread parses the questions file, converter thread runs
+the conversion (optionally with worker processes), writer is
+the consumer of the pipeline. Full queues block the previous stage,
+so memory is bounded by the queue size.
+
+Each stage measures time spent waiting for input and for space in
+the output queue: reader waiting for output means the run is limited
+by conversion, converter waiting for input means it is limited
+by reading, converter waiting for output means it is limited by writing.
+"""
+import sys
+import time
+import queue
+import threading
+import itertools
+
+from budget import convert_questions
+
+
+_END = object()
+
+
+class _Failure:
+    def __init__(self, error):
+        self.error = error
+
+
+class StageTimer:
+    def __init__(self, name):
+        self.name = name
+        self.wait_input = 0.0
+        self.wait_output = 0.0
+        self.items = 0
+        self.start = time.perf_counter()
+        self.end = None
+
+    def stop(self):
+        self.end = time.perf_counter()
+
+    def report(self, file=sys.stderr):
+        total = (self.end or time.perf_counter()) - self.start
+        print('{0}: {1} items in {2:.2f}s, waiting for input {3:.2f}s, '
+              'waiting for output {4:.2f}s'.format(self.name, self.items, total,
+                                                    self.wait_input, self.wait_output),
+              file=file)
+
+
+def _get(q, timer):
+    start = time.perf_counter()
+    item = q.get()
+    timer.wait_input += time.perf_counter() - start
+    return item
+
+
+def _put(q, item, timer):
+    start = time.perf_counter()
+    q.put(item)
+    timer.wait_output += time.perf_counter() - start
+
+
+def _drain(q, timer):
+    while True:
+        chunk = _get(q, timer)
+        if chunk is _END:
+            return
+        if isinstance(chunk, _Failure):
+            raise chunk.error
+        yield from chunk
+
+
+def _stage(timer, items, q, chunk_size):
+    """
+    items are passed between stages in chunks to save on locking of queues
+    """
+    try:
+        items = iter(items)
+        while True:
+            chunk = list(itertools.islice(items, chunk_size))
+            if not chunk:
+                break
+            _put(q, chunk, timer)
+            timer.items += len(chunk)
+        _put(q, _END, timer)
+    except BaseException as e:
+        _put(q, _Failure(e), timer)
+    finally:
+        timer.stop()
+
+
+class Pipeline:
+    """
+    iterate to get (question_id, record, converted expression, variables)
+
+    questions: iterable of (question_id, record), read in reader thread
+    """
+    def __init__(self, questions, queue_size=1024, budget=None, batch_size=256, workers=0,
+                 chunk_size=64):
+        self.questions = questions
+        self.queue_size = queue_size
+        self.chunk_size = chunk_size
+        self.budget = budget
+        self.batch_size = batch_size
+        self.workers = workers
+        self.reader = StageTimer('reader')
+        self.converter = StageTimer('converter')
+        self.writer = StageTimer('writer')
+
+    def __iter__(self):
+        # queue_size is given in questions
+        size = max(1, self.queue_size // self.chunk_size)
+        read_q = queue.Queue(size)
+        converted_q = queue.Queue(size)
+        threading.Thread(target=_stage,
+                         args=(self.reader, self.questions, read_q, self.chunk_size),
+                         daemon=True).start()
+        converted = convert_questions(_drain(read_q, self.converter), self.budget,
+                                      self.batch_size, self.workers)
+        threading.Thread(target=_stage,
+                         args=(self.converter, converted, converted_q, self.chunk_size),
+                         daemon=True).start()
+        try:
+            for item in _drain(converted_q, self.writer):
+                self.writer.items += 1
+                yield item
+        finally:
+            self.writer.stop()
+
+    def report(self, file=sys.stderr):
+        for timer in (self.reader, self.converter, self.writer):
+            timer.report(file)
@@ -0,0 +1,178 @@
+"""
+Streaming reader for GQA questions files.
+
+Questions file is one large json object {question_id: record}.
+Records are cut out of the file as raw text, filters are checked
+on the raw text, only matching records are parsed with json.
+"""
+import re
+import json
+import itertools
+
+
+_token_re = re.compile(r'"(?:[^"\\]|\\.)*(?:"|\\?\Z)|[{}\[\]]')
+_string_re = re.compile(r'"(?:[^"\\]|\\.)*"')
+_space_re = re.compile(r'[\s,:]*')
+_image_re = re.compile(r'"imageId":\s*"((?:[^"\\]|\\.)*)"')
+_operation_re = re.compile(r'"operation":\s*"((?:[^"\\]|\\.)*)"')
+_types_re = re.compile(r'"types":\s*(\{[^{}]*\})')
+
+
+def _value_end(buf, start):
+    """
+    position after json object or array starting at start,
+    None if it is not complete in buf
+    """
+    depth = 0
+    for m in _token_re.finditer(buf, start):
+        token = m.group()
+        if token[0] == '"':
+            if m.end() == len(buf):
+                return None
+        elif token in '{[':
+            depth += 1
+        else:
+            depth -= 1
+            if depth == 0:
+                return m.end()
+    return None
+
+
+_decoder = json.JSONDecoder()
+
+
+def _decode_end(buf, start):
+    """
+    parsed json value starting at start and position after it,
+    None if it is not complete in buf
+    """
+    try:
+        return _decoder.raw_decode(buf, start)
+    except json.JSONDecodeError:
+        return None
+
+
+def _raw_end(buf, start):
+    end = _value_end(buf, start)
+    if end is None:
+        return None
+    return buf[start:end], end
+
+
+def iter_raw(f, chunk_size=1 << 22, decode=False):
+    """
+    yield (question_id, raw json text of record) from open questions file,
+    with decode records are parsed right away instead
+    """
+    value_end = _decode_end if decode else _raw_end
+    buf = f.read(chunk_size)
+    pos = buf.index('{') + 1
+    eof = False
+    while True:
+        pos = _space_re.match(buf, pos).end()
+        key_m = None
+        value = None
+        if pos < len(buf):
+            if buf[pos] == '}':
+                return
+            key_m = _string_re.match(buf, pos)
+        if key_m is not None:
+            start = _space_re.match(buf, key_m.end()).end()
+            value = value_end(buf, start)
+        if value is None:
+            if eof:
+                raise ValueError('unexpected end of questions file')
+            buf = buf[pos:]
+            pos = 0
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buf += chunk
+            continue
+        record, pos = value
+        yield json.loads(key_m.group()), record
+
+
+def handler_used(operations, handlers):
+    """
+    any of operations is one of handlers, handler is a whole operation
+    like 'verify rel' or its first word
+    """
+    for op in operations:
+        for h in handlers:
+            if op == h or op.split()[0] == h:
+                return True
+    return False
+
+
+class RecordFilter:
+    """
+    Select questions by id, image id, operations of semantic program
+    and types. Values inside one criterion are alternatives, all given
+    criteria must hold.
+    """
+    def __init__(self, question_ids=(), image_ids=(), operations=(), types=()):
+        self.question_ids = set(question_ids)
+        self.image_ids = set(image_ids)
+        self.operations = list(operations)
+        # 'structural=compare' or just 'compare' for any kind of type
+        self.types = [t.split('=', 1) if '=' in t else (None, t) for t in types]
+
+    def __bool__(self):
+        return bool(self.question_ids or self.image_ids or self.operations or self.types)
+
+    def done(self, seen):
+        """
+        all requested question ids are found
+        """
+        return bool(self.question_ids) and seen == len(self.question_ids)
+
+    def match(self, key, raw):
+        if self.question_ids and key not in self.question_ids:
+            return False
+        if self.image_ids:
+            m = _image_re.search(raw)
+            if m is None or m.group(1) not in self.image_ids:
+                return False
+        if self.operations:
+            ops = [' '.join(op.split()) for op in _operation_re.findall(raw)]
+            if not handler_used(ops, self.operations):
+                return False
+        if self.types:
+            m = _types_re.search(raw)
+            if m is None:
+                return False
+            types = json.loads(m.group(1))
+            if not any(types.get(kind) == value if kind else value in types.values()
+                       for (kind, value) in self.types):
+                return False
+        return True
+
+
+def iter_questions(f, record_filter=None, chunk_size=1 << 22):
+    """
+    yield (question_id, record) for questions accepted by filter
+    """
+    if not record_filter:
+        # nothing to check on raw text, parse records while cutting them out
+        yield from iter_raw(f, chunk_size, decode=True)
+        return
+    seen = 0
+    for key, raw in iter_raw(f, chunk_size):
+        if not record_filter.match(key, raw):
+            continue
+        yield key, json.loads(raw)
+        seen += 1
+        if record_filter.done(seen):
+            return
+
+
+def iter_batches(items, size):
+    """
+    yield lists of at most size items
+    """
+    items = iter(items)
+    while True:
+        batch = list(itertools.islice(items, size))
+        if not batch:
+            return
+        yield batch
@@ -0,0 +1,269 @@
+"""
+Long-running conversion service.
+
+Listens on localhost HTTP port or on unix socket, relation tables
+are loaded once. Requests queued while the converter thread is busy
+are taken as one micro-batch, identical programs of a batch are
+converted once. With --max-delay the converter also waits for a batch
+to fill, which trades latency of single requests for larger batches.
+
+    python service.py --port 8765
+    python service.py --unix /tmp/gqa-converter.sock
+
+POST /convert with json body: semantic program as a list of steps or
+{"semantic": [...]}; response:
+{"readable": "...", "spaces": "...", "ast": [...]} or {"error": "..."}
+
+GET /stats returns number of converted programs, p50/p99 latency in ms
+and throughput over the last minute.
+"""
+import os
+import sys
+import json
+import time
+import queue
+import argparse
+import threading
+import socketserver
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from converter import build_program, to_spaces
+from atomese import program_term
+
+
+def ast(term):
+    """
+    compact form of atomese term: ["and", ["object", "horse", "$Y"], ...]
+    """
+    if term[0] == 'EvaluationLink':
+        return [term[1][1]] + [ast(t) for t in term[2][1:]]
+    if term[0] in ('AndLink', 'OrLink'):
+        return [term[0][:-4].lower()] + [ast(t) for t in term[1:]]
+    if term[0] == 'GlobNode':
+        return 'list({0})'.format(term[1])
+    return term[1]
+
+
+operations = {'select', 'filter', 'exist', 'or', 'relate', 'verify', 'and', 'query',
+              'choose', 'different', 'same', 'common'}
+
+
+def check_program(sem):
+    """
+    converter falls into debugger on unknown steps, reject them beforehand
+    """
+    if not sem:
+        raise ValueError('empty program')
+    for item in sem:
+        operation = item['operation'].strip().split()
+        if not operation or operation[0] not in operations:
+            raise ValueError('unknown operation {0!r}'.format(item['operation']))
+        if operation[0] == 'select' and not item['argument']:
+            raise ValueError('select without argument')
+
+
+def convert_request(sem):
+    check_program(sem)
+    root = build_program(sem)
+    res = root.build_expression()
+    return dict(readable=res, spaces=to_spaces(res), ast=ast(program_term(root)))
+
+
+class Request:
+    def __init__(self, sem):
+        self.sem = sem
+        self.start = time.perf_counter()
+        self.done = threading.Event()
+        self.result = None
+
+
+class LatencyStats:
+    """
+    latencies of last requests and throughput over last period seconds
+    """
+    def __init__(self, window=10000, period=60):
+        self.latencies = deque(maxlen=window)
+        self.finished = deque()
+        self.period = period
+        self.count = 0
+        self.batches = 0
+        self.start = time.perf_counter()
+        self.lock = threading.Lock()
+
+    def _expire(self, now):
+        while self.finished and self.finished[0] < now - self.period:
+            self.finished.popleft()
+
+    def add(self, latency):
+        now = time.perf_counter()
+        with self.lock:
+            self.latencies.append(latency)
+            self.finished.append(now)
+            self._expire(now)
+            self.count += 1
+
+    def add_batch(self):
+        with self.lock:
+            self.batches += 1
+
+    def percentile(self, values, p):
+        if not values:
+            return None
+        return values[min(len(values) - 1, int(p * len(values)))] * 1000
+
+    def to_json(self):
+        now = time.perf_counter()
+        with self.lock:
+            self._expire(now)
+            values = sorted(self.latencies)
+            count = self.count
+            batches = self.batches
+            recent = len(self.finished)
+        elapsed = min(self.period, now - self.start)
+        return dict(count=count, batches=batches,
+                    p50_ms=self.percentile(values, 0.5),
+                    p99_ms=self.percentile(values, 0.99),
+                    throughput=recent / elapsed if elapsed else 0)
+
+
+class Batcher:
+    """
+    collects requests into batches of at most batch_size: all requests
+    queued so far, waiting at most max_delay seconds for more
+    """
+    def __init__(self, batch_size=64, max_delay=0):
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.queue = queue.Queue()
+        self.stats = LatencyStats()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self, sem):
+        request = Request(sem)
+        self.queue.put(request)
+        request.done.wait()
+        return request.result
+
+    def next_batch(self):
+        batch = [self.queue.get()]
+        deadline = time.perf_counter() + self.max_delay
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.perf_counter()
+            try:
+                if timeout > 0:
+                    batch.append(self.queue.get(timeout=timeout))
+                else:
+                    batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def run(self):
+        while True:
+            batch = self.next_batch()
+            # same question asked by several clients is converted once
+            results = dict()
+            for request in batch:
+                try:
+                    key = json.dumps(request.sem, sort_keys=True)
+                except (TypeError, ValueError):
+                    key = None
+                result = results.get(key) if key is not None else None
+                if result is None:
+                    try:
+                        result = convert_request(request.sem)
+                    except Exception as e:
+                        result = dict(error='{0}: {1}'.format(type(e).__name__, e))
+                    if key is not None:
+                        results[key] = result
+                request.result = result
+                self.stats.add(time.perf_counter() - request.start)
+                request.done.set()
+            self.stats.add_batch()
+
+
+class Handler(BaseHTTPRequestHandler):
+    batcher = None
+
+    def _reply(self, code, data):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/stats':
+            self._reply(200, self.batcher.stats.to_json())
+        else:
+            self._reply(404, dict(error='unknown path'))
+
+    def do_POST(self):
+        if self.path != '/convert':
+            self._reply(404, dict(error='unknown path'))
+            return
+        length = int(self.headers.get('Content-Length', 0))
+        try:
+            data = json.loads(self.rfile.read(length))
+        except ValueError as e:
+            self._reply(400, dict(error='bad json: {0}'.format(e)))
+            return
+        sem = data.get('semantic') if isinstance(data, dict) else data
+        result = self.batcher.submit(sem)
+        self._reply(400 if 'error' in result else 200, result)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# default listen backlog of 5 resets connections under concurrent load
+listen_backlog = 1024
+
+
+class HTTPServer(ThreadingHTTPServer):
+    request_queue_size = listen_backlog
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    request_queue_size = listen_backlog
+
+    def get_request(self):
+        request, _ = super().get_request()
+        # BaseHTTPRequestHandler expects (host, port)
+        return request, ('unix', 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='GQA program conversion service')
+    parser.add_argument('--port', type=int, default=8765, help='localhost http port')
+    parser.add_argument('--unix', help='listen on unix socket instead of port')
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--max-delay', type=float, default=0,
+                        help='ms to wait for a batch to fill, by default only '
+                             'already queued requests are batched')
+    args = parser.parse_args()
+    Handler.batcher = Batcher(args.batch_size, args.max_delay / 1000)
+    if args.unix:
+        if os.path.exists(args.unix):
+            os.unlink(args.unix)
+        server = UnixHTTPServer(args.unix, Handler)
+        print('listening on {0}'.format(args.unix), file=sys.stderr)
+    else:
+        server = HTTPServer(('127.0.0.1', args.port), Handler)
+        print('listening on 127.0.0.1:{0}'.format(args.port), file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if args.unix:
+            os.unlink(args.unix)
+
+
+if __name__ == '__main__':
+    main()
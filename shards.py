@@ -0,0 +1,119 @@
+"""
+Length-bucketed output shards for language model training.
+
+Converted programs are put into buckets by number of tokens of the
+spaces form. Inside a bucket records are shuffled with a seeded
+random generator and written to shards of --shard-size records:
+
+    out_dir/len016-031.00000.jsonl
+    out_dir/manifest.json
+
+Each line is {"id", "question", "readable", "spaces", "length"}.
+manifest.json lists buckets with their length range, number of
+records and shard files. Same input and seed give the same shards.
+
+Buckets are kept in temporary files during conversion, buckets
+larger than pile_size are shuffled in two passes: records are
+scattered to random piles which are shuffled in memory one by one.
+"""
+import os
+import json
+import random
+import shutil
+import bisect
+import tempfile
+
+from converter import to_spaces
+
+
+default_boundaries = [8, 16, 24, 32, 48, 64, 96, 128]
+
+
+class ShardWriter:
+    def __init__(self, out_dir, boundaries=None, seed=0, shard_size=100000,
+                 pile_size=200000):
+        self.out_dir = out_dir
+        self.boundaries = sorted(boundaries or default_boundaries)
+        self.seed = seed
+        self.shard_size = shard_size
+        self.pile_size = pile_size
+        os.makedirs(out_dir, exist_ok=True)
+        # own directory, files already in out_dir are never removed
+        self.tmp_dir = tempfile.mkdtemp(prefix='buckets-', dir=out_dir)
+        self.files = dict()
+        self.counts = dict()
+
+    def bucket_range(self, bucket):
+        low = self.boundaries[bucket - 1] if bucket else 0
+        high = self.boundaries[bucket] - 1 if bucket < len(self.boundaries) else None
+        return low, high
+
+    def bucket_name(self, bucket):
+        low, high = self.bucket_range(bucket)
+        if high is None:
+            return 'len{0:03d}-inf'.format(low)
+        return 'len{0:03d}-{1:03d}'.format(low, high)
+
+    def add(self, key, question, res):
+        spaces = to_spaces(res)
+        length = len(spaces.split())
+        bucket = bisect.bisect_right(self.boundaries, length)
+        if bucket not in self.files:
+            self.files[bucket] = open(os.path.join(self.tmp_dir, '{0}.jsonl'.format(bucket)), 'w')
+            self.counts[bucket] = 0
+        record = dict(id=key, question=question, readable=res, spaces=spaces, length=length)
+        self.files[bucket].write(json.dumps(record) + '\n')
+        self.counts[bucket] += 1
+
+    def _shuffled(self, bucket, rng):
+        path = os.path.join(self.tmp_dir, '{0}.jsonl'.format(bucket))
+        piles = -(-self.counts[bucket] // self.pile_size)
+        if piles <= 1:
+            with open(path) as f:
+                lines = f.readlines()
+            rng.shuffle(lines)
+            yield from lines
+            return
+        pile_paths = [path + '.{0}'.format(i) for i in range(piles)]
+        pile_files = [open(p, 'w') for p in pile_paths]
+        with open(path) as f:
+            for line in f:
+                pile_files[rng.randrange(piles)].write(line)
+        for pile in pile_files:
+            pile.close()
+        for pile_path in pile_paths:
+            with open(pile_path) as f:
+                lines = f.readlines()
+            os.unlink(pile_path)
+            rng.shuffle(lines)
+            yield from lines
+
+    def _write_bucket(self, bucket):
+        # generator per bucket, so buckets don't depend on each other
+        rng = random.Random('{0}:{1}'.format(self.seed, bucket))
+        name = self.bucket_name(bucket)
+        shards = []
+        out = None
+        for i, line in enumerate(self._shuffled(bucket, rng)):
+            if i % self.shard_size == 0:
+                if out is not None:
+                    out.close()
+                shards.append('{0}.{1:05d}.jsonl'.format(name, len(shards)))
+                out = open(os.path.join(self.out_dir, shards[-1]), 'w')
+            out.write(line)
+        if out is not None:
+            out.close()
+        low, high = self.bucket_range(bucket)
+        return dict(name=name, min_length=low, max_length=high,
+                    count=self.counts[bucket], shards=shards)
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+        buckets = [self._write_bucket(bucket) for bucket in sorted(self.files)]
+        shutil.rmtree(self.tmp_dir)
+        manifest = dict(seed=self.seed, boundaries=self.boundaries,
+                        shard_size=self.shard_size, buckets=buckets)
+        with open(os.path.join(self.out_dir, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f, indent=2)
+        return manifest
@@ -0,0 +1,202 @@
+"""
+Dataset statistics collected during conversion.
+
+All accumulators use bounded memory and can be merged,
+so statistics of shards or workers are combined with
+
+    python stats.py total.json shard1.json shard2.json ...
+"""
+import re
+import sys
+import json
+
+from converter import to_spaces, relate_phrases
+
+
+_connective_re = re.compile(' and | or ')
+
+
+def token_count(res):
+    """
+    number of tokens in spaces format
+    """
+    return len(to_spaces(res).split())
+
+
+class Histogram:
+    """
+    counts of integer values
+    """
+    def __init__(self, counts=None):
+        self.counts = dict(counts or {})
+
+    def add(self, value):
+        self.counts[value] = self.counts.get(value, 0) + 1
+
+    def merge(self, other):
+        for value, count in other.counts.items():
+            self.counts[value] = self.counts.get(value, 0) + count
+
+    def total(self):
+        return sum(self.counts.values())
+
+    def percentile(self, p):
+        total = self.total()
+        seen = 0
+        for value in sorted(self.counts):
+            seen += self.counts[value]
+            if seen >= p * total:
+                return value
+        return None
+
+    def to_json(self):
+        total = self.total()
+        result = dict(count=total,
+                      histogram={str(k): v for (k, v) in sorted(self.counts.items())})
+        if total:
+            result.update(min=min(self.counts), max=max(self.counts),
+                          mean=sum(k * v for (k, v) in self.counts.items()) / total,
+                          p50=self.percentile(0.5), p90=self.percentile(0.9),
+                          p99=self.percentile(0.99))
+        return result
+
+    @classmethod
+    def from_json(cls, data):
+        return cls({int(k): v for (k, v) in data['histogram'].items()})
+
+
+class TopK:
+    """
+    approximate most frequent items, Space-Saving algorithm
+
+    counts may be overestimated by at most errors[item]
+    """
+    def __init__(self, k=100):
+        self.k = k
+        self.counts = dict()
+        self.errors = dict()
+
+    def add(self, item, count=1, error=0):
+        if item in self.counts:
+            self.counts[item] += count
+            self.errors[item] += error
+        elif len(self.counts) < self.k:
+            self.counts[item] = count
+            self.errors[item] = error
+        else:
+            victim = min(self.counts, key=self.counts.get)
+            low = self.counts.pop(victim)
+            self.errors.pop(victim)
+            self.counts[item] = low + count
+            self.errors[item] = low + error
+
+    def _floor(self):
+        if len(self.counts) < self.k:
+            return 0
+        return min(self.counts.values())
+
+    def merge(self, other):
+        floor_self, floor_other = self._floor(), other._floor()
+        self.k = min(self.k, other.k)
+        counts = dict()
+        errors = dict()
+        for item in set(self.counts) | set(other.counts):
+            counts[item] = self.counts.get(item, floor_self) + \
+                other.counts.get(item, floor_other)
+            errors[item] = self.errors.get(item, floor_self) + \
+                other.errors.get(item, floor_other)
+        top = sorted(counts, key=counts.get, reverse=True)[:self.k]
+        self.counts = {item: counts[item] for item in top}
+        self.errors = {item: errors[item] for item in top}
+
+    def to_json(self):
+        top = sorted(self.counts, key=self.counts.get, reverse=True)
+        return dict(k=self.k, items=[[item, self.counts[item], self.errors[item]]
+                                     for item in top])
+
+    @classmethod
+    def from_json(cls, data):
+        result = cls(data['k'])
+        for item, count, error in data['items']:
+            result.counts[item] = count
+            result.errors[item] = error
+        return result
+
+
+class DatasetStats:
+    _histograms = ('program_length', 'atoms', 'variables', 'tokens', 'disjunctions')
+
+    def __init__(self, k=100):
+        self.questions = 0
+        self.list_groundings = 0
+        for name in self._histograms:
+            setattr(self, name, Histogram())
+        self.relations = TopK(k)
+
+    def add(self, sem, res, variables):
+        """
+        sem: semantic program
+        res: converted expression
+        variables: object ids to variable names from get_var_name
+        """
+        self.questions += 1
+        self.program_length.add(len(sem))
+        self.atoms.add(len(_connective_re.split(res)))
+        self.variables.add(len(variables))
+        self.tokens.add(token_count(res))
+        self.disjunctions.add(res.count(' or '))
+        if 'list(' in res:
+            self.list_groundings += 1
+        for item in sem:
+            operation = item['operation'].strip().split()
+            for phrase in relate_phrases(operation, item['argument']):
+                self.relations.add(phrase)
+
+    def merge(self, other):
+        self.questions += other.questions
+        self.list_groundings += other.list_groundings
+        for name in self._histograms:
+            getattr(self, name).merge(getattr(other, name))
+        self.relations.merge(other.relations)
+
+    def to_json(self):
+        result = dict(questions=self.questions,
+                      list_groundings=self.list_groundings,
+                      list_share=self.list_groundings / self.questions if self.questions else 0,
+                      relations=self.relations.to_json())
+        for name in self._histograms:
+            result[name] = getattr(self, name).to_json()
+        return result
+
+    @classmethod
+    def from_json(cls, data):
+        result = cls()
+        result.questions = data['questions']
+        result.list_groundings = data['list_groundings']
+        result.relations = TopK.from_json(data['relations'])
+        for name in cls._histograms:
+            setattr(result, name, Histogram.from_json(data[name]))
+        return result
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_json(), f, indent=2)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls.from_json(json.load(f))
+
+
+def main():
+    if len(sys.argv) < 3:
+        print('usage: stats.py total.json shard1.json [shard2.json ...]')
+        return
+    total = DatasetStats.load(sys.argv[2])
+    for path in sys.argv[3:]:
+        total.merge(DatasetStats.load(path))
+    total.save(sys.argv[1])
+
+
+if __name__ == '__main__':
+    main()
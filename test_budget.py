@@ -0,0 +1,73 @@
+"""
+Peak memory of --memory-budget conversion doesn't grow with input size.
+
+    python -m pytest test_budget.py
+"""
+import os
+import re
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+import subprocess
+
+from converter import convert_program
+from equivalence import synthetic_programs
+
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+
+def write_questions(path, count):
+    with open(path, 'w') as f:
+        f.write('{')
+        first = True
+        for key, sem in synthetic_programs(count, seed=1):
+            try:
+                convert_program(sem)
+            except Exception:
+                # programs converter fails on would stop the run
+                continue
+            if not first:
+                f.write(', ')
+            first = False
+            record = dict(question='question {0}'.format(key), semantic=sem)
+            f.write('{0}: {1}'.format(json.dumps(key), json.dumps(record)))
+        f.write('}')
+
+
+def peak_rss(path, out_path, budget_mb=200):
+    """
+    peak rss in MB printed by converter.py
+    """
+    proc = subprocess.run([sys.executable, os.path.join(here, 'converter.py'), path,
+                           '--output', out_path, '--memory-budget', str(budget_mb)],
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                          universal_newlines=True, check=True)
+    return float(re.search(r'peak rss: ([\d.]+) MB', proc.stderr).group(1))
+
+
+class MemoryBudgetTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_memory_is_flat(self):
+        peaks = []
+        sizes = []
+        for count in (2000, 40000):
+            path = os.path.join(self.tmp_dir, 'questions{0}.json'.format(count))
+            write_questions(path, count)
+            sizes.append(os.path.getsize(path))
+            peaks.append(peak_rss(path, os.path.join(self.tmp_dir, 'out.txt')))
+        # input grows 20 times, loading it whole would grow rss by its size
+        self.assertGreater(sizes[1], 15 * sizes[0])
+        self.assertLess(peaks[1], peaks[0] * 1.2 + 5)
+        self.assertLess(peaks[1] - peaks[0], (sizes[1] - sizes[0]) / 1024 / 1024 / 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
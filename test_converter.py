@@ -0,0 +1,79 @@
+"""
+Variables of converted programs are usable as integer slots,
+unknown relation phrases are decomposed only with known activities.
+
+    python -m pytest test_converter.py
+"""
+import unittest
+
+from converter import Var, ListVar, Node, same_var, extract_deps, var_name, \
+    convert_program, lexicon, scan_relations
+
+
+class VarTest(unittest.TestCase):
+    def test_equal_to_slot(self):
+        for k in range(8):
+            self.assertEqual(Var(k), k)
+            self.assertEqual(hash(Var(k)), hash(k))
+            self.assertIn(Var(k), list(range(8)))
+            self.assertEqual({k: 'x'}.get(Var(k)), 'x')
+
+    def test_names(self):
+        self.assertEqual(str(Var(0)), '$X')
+        self.assertEqual(str(Var(5)), '$V5')
+        self.assertEqual(str(ListVar(1)), 'list($Y)')
+        self.assertEqual(var_name(Var(6)), '$V6')
+
+    def test_list_is_other_variable(self):
+        self.assertTrue(same_var(Var(1), Var(1)))
+        self.assertFalse(same_var(ListVar(1), Var(1)))
+        deps = [Node([], [ListVar(0)]), Node([], [Var(0), Var(1)])]
+        self.assertEqual([str(v) for v in extract_deps(deps)], ['list($X)', '$X', '$Y'])
+
+    def test_program_slots(self):
+        variables = dict()
+        sem = [dict(operation='select', dependencies=[], argument='horse (1)'),
+               dict(operation='relate', dependencies=[0],
+                    argument='water,in,o (2)'),
+               dict(operation='verify size', dependencies=[1], argument='small')]
+        res = convert_program(sem, variables)
+        self.assertEqual(variables, {'1': 0, '2': 1})
+        self.assertEqual(res, 'verify_size(small, $Y) and in($X, $Y) and '
+                              'object(water, $Y) and object(horse, $X)')
+
+
+def relate(phrase):
+    return [dict(operation='select', dependencies=[], argument='man (1)'),
+            dict(operation='relate', dependencies=[0],
+                 argument='street,{0},o (2)'.format(phrase)),
+            dict(operation='query', dependencies=[1], argument='name')]
+
+
+class LexiconTest(unittest.TestCase):
+    accepted = ['skating along', 'riding near', 'grazing near']
+    rejected = ['wing of', 'red on', 'bed on', 'something on', 'nothing near',
+                'jogging along']
+
+    def test_accepted(self):
+        for phrase in self.accepted:
+            self.assertIn(phrase, lexicon)
+        self.assertEqual(convert_program(relate('skating along')),
+                         'query(name, $Y) and along($X, $Y) and activity(skating, $X) and '
+                         'object(street, $Y) and object(man, $X)')
+
+    def test_rejected(self):
+        for phrase in self.rejected:
+            self.assertNotIn(phrase, lexicon)
+            with self.assertRaises(KeyError):
+                convert_program(relate(phrase))
+
+    def test_scan(self):
+        questions = [(str(i), dict(semantic=relate(p)))
+                     for i, p in enumerate(self.accepted + self.rejected)]
+        unmapped, decomposed = scan_relations(questions)
+        self.assertEqual(set(unmapped), set(self.rejected))
+        self.assertEqual(set(decomposed), set(self.accepted))
+
+
+if __name__ == '__main__':
+    unittest.main()
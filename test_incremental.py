@@ -0,0 +1,82 @@
+"""
+Rebuild from manifest gives the same output as a full conversion.
+
+    python -m pytest test_incremental.py
+"""
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+import incremental
+from converter import relations, Same, convert_program, write_result
+from equivalence import synthetic_programs
+
+
+def questions(count):
+    data = dict()
+    for key, sem in synthetic_programs(count, seed=2):
+        try:
+            convert_program(sem)
+        except Exception:
+            continue
+        data[key] = dict(question='question {0}'.format(key), semantic=sem)
+    return data
+
+
+def convert_all(data, path, manifest_path=None):
+    usage = dict()
+    with open(path, 'w') as out:
+        for key, record in data.items():
+            write_result(out, key, record['question'], convert_program(record['semantic']))
+            usage[key] = incremental.program_usage(record['semantic'])
+    if manifest_path:
+        incremental.write_manifest(manifest_path, usage)
+
+
+class RebuildTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.output = os.path.join(self.tmp_dir, 'out.txt')
+        self.full = os.path.join(self.tmp_dir, 'full.txt')
+        self.manifest = os.path.join(self.tmp_dir, 'manifest.json')
+        self.data = questions(500)
+        convert_all(self.data, self.output, self.manifest)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def rebuild_matches_full_run(self):
+        incremental.rebuild(self.data, self.output, self.manifest)
+        convert_all(self.data, self.full)
+        with open(self.output) as f, open(self.full) as g:
+            self.assertEqual(f.read(), g.read())
+
+    def test_unchanged(self):
+        with open(self.manifest) as f:
+            self.assertEqual(incremental.affected_questions(json.load(f)), [])
+
+    def test_table_entry(self):
+        rel = relations['on']
+        old = rel.rel_name
+        rel.rel_name = 'upon'
+        try:
+            with open(self.manifest) as f:
+                self.assertTrue(incremental.affected_questions(json.load(f)))
+            self.rebuild_matches_full_run()
+        finally:
+            rel.rel_name = old
+
+    def test_node_class(self):
+        Same._name = 'equal'
+        try:
+            self.rebuild_matches_full_run()
+            with open(self.output) as f:
+                self.assertIn('equal(color', f.read())
+        finally:
+            Same._name = 'same'
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+"""
+Parsed programs have the same nodes as built by the converter.
+
+    python -m pytest test_lf_parser.py
+"""
+import io
+import unittest
+
+from converter import IfElse, IfElseNot, build_program, to_spaces
+from lf_parser import parse, parse_spaces, to_text, iter_output
+
+
+def choose(operation):
+    return [dict(operation='select', dependencies=[], argument='hot dog (1)'),
+            dict(operation='select', dependencies=[], argument='tomato (2)'),
+            dict(operation=operation, dependencies=[0, 1], argument='')]
+
+
+def objects(cond):
+    return [(d.name, str(d.variables[0])) for d in cond.dependencies]
+
+
+class CondTest(unittest.TestCase):
+    def check(self, operation, cls):
+        expected = build_program(choose(operation))
+        text = expected.build_expression()
+        for root in (parse(text), parse_spaces(to_spaces(text))):
+            cond = root.dependencies[0]
+            self.assertIs(type(cond), cls)
+            self.assertEqual(cond.comparator, 'healthier')
+            self.assertEqual(objects(cond), objects(expected))
+            # dependencies are the object atoms of the program, not new ones
+            for dep in cond.dependencies:
+                self.assertTrue(any(dep is atom for atom in root.dependencies[1:]))
+        self.assertEqual(to_text(parse(text)), text)
+
+    def test_healthier(self):
+        self.check('choose healthier', IfElse)
+
+    def test_less_healthy(self):
+        self.check('choose less healthy', IfElseNot)
+
+    def test_readme_example(self):
+        root = parse('cond(healthier($X, $Y), hot_dog, tomato) and '
+                     'object(tomato, $X) and object(hot_dog, $Y)')
+        cond = root.dependencies[0]
+        self.assertIs(type(cond), IfElseNot)
+        self.assertEqual(objects(cond), [('tomato', '$X'), ('hot_dog', '$Y')])
+
+
+class IterOutputTest(unittest.TestCase):
+    def test_pairs(self):
+        f = io.StringIO('1:  is it red?\n1:  verify_color(red, $X) and object(car, $X)\n')
+        [(key, root)] = list(iter_output(f))
+        self.assertEqual(key, '1')
+        self.assertEqual(to_text(root), 'verify_color(red, $X) and object(car, $X)')
+
+    def test_dangling_question(self):
+        f = io.StringIO('1:  is it red?\n1:  exists($X) and object(car, $X)\n2:  is it?\n')
+        with self.assertRaisesRegex(ValueError, '2:  is it\\?'):
+            list(iter_output(f))
+
+
+if __name__ == '__main__':
+    unittest.main()